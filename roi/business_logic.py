@@ -1,10 +1,19 @@
 import time
-from uuid import uuid4
-from typing import Union, List
+import logging
+import secrets
+import itertools
+from collections import OrderedDict
+from typing import (Callable, Dict, Iterator, List, Set, Tuple, Type, Union,
+                    OrderedDict as OrderedDictType)
 from eventfactory import Detection
 from eventfactory import EventEndedSignal, EventStartedSignal
 from eventfactory.pipeline.steps import BusinessLogic
 
+# shared result for frames that neither start nor end any event
+_EMPTY = ()
+
+logger = logging.getLogger(__name__)
+
 
 class Event():
     """
@@ -23,8 +32,6 @@ class Event():
 
     Methods:
     --------
-    _reset_ttl() -> None:
-        Resets the time-to-live value for the event
     no_detection() -> None:
         Decreases current time-to-live value when the object is not detected in
         the current frame
@@ -35,15 +42,16 @@ class Event():
         elapsed
     """
 
-    def __init__(self, detection: Detection, ttl: int) -> None:
-        self.detection = detection
-        self.num_detected_frames = 1
-        self.creation_time = time.time()
-        self.ttl = ttl
-        self.current_ttl = self.ttl
+    __slots__ = ("detection", "num_detected_frames", "creation_time", "ttl",
+                 "current_ttl")
 
-    def _reset_ttl(self) -> None:
-        self.current_ttl = self.ttl
+    def __init__(self, detection: Detection, ttl: int,
+                 _time: Callable[[], float] = time.time) -> None:
+        self.detection: Detection = detection
+        self.num_detected_frames: int = 1
+        self.creation_time: float = _time()
+        self.ttl: int = ttl
+        self.current_ttl: int = self.ttl
 
     def no_detection(self) -> None:
         self.current_ttl -= 1
@@ -59,7 +67,7 @@ class Event():
         """
         self.detection = detection
         self.num_detected_frames += 1
-        self._reset_ttl()
+        self.current_ttl = self.ttl
 
     def is_expired(self) -> bool:
         return self.current_ttl <= 0
@@ -77,108 +85,203 @@ class RoIBusinessLogic(BusinessLogic):
     ttl : int
         The number of frames for which an object needs to not be detected for an
         event to be considered ended.
+    max_classes : int
+        The maximum number of classes tracked at once. When exceeded, the
+        least recently detected classes are evicted, and ended if active.
 
     Methods:
     --------
-    _get_starting_events() -> List[EventStartedSignal]:
-        Returns a list of new events that have just started.
-    _get_ending_events() -> List[EventEndedSignal]:
-        Returns a list of events that have just ended.
-    _is_start_event(key: str, event: Event) -> bool:
-        Returns True if the event should be considered started.
-    _is_end_event(key: str) -> bool:
-        Returns True if the event should be considered ended.
-    process(detection: Detection) -> List[Union[EventEndedSignal,
-                                                EventStartedSignal]]:
-        Processes a new detection and returns a list of events that have
+    _collect_events(current_frame_classes: Set[str])
+            -> List[Union[EventStartedSignal, EventEndedSignal]]:
+        Ages the events not seen in the current frame, returns a list of
+        events that have just started or ended, and drops the expired ones.
+    _age_events() -> List[EventEndedSignal]:
+        Ages all events for a frame without predictions and returns the ones
+        that have just ended.
+    _drop_expired(num_expired: int) -> None:
+        Removes the expired events from the event dictionary.
+    _evict_events() -> List[EventEndedSignal]:
+        Evicts the least recently detected events above max_classes and
+        returns the end signals of the active ones.
+    _process_frame(detection: Detection, current_frame_classes: Set[str])
+            -> List[Union[EventStartedSignal, EventEndedSignal]]:
+        Updates the events with one frame and returns the ones that have
+        started or ended.
+    process(detection: Detection) -> Tuple[Union[EventEndedSignal,
+                                                 EventStartedSignal], ...]:
+        Processes a new detection and returns a tuple of events that have
         started of ended.
+    process_batch(detections: List[Detection])
+            -> Tuple[Union[EventEndedSignal, EventStartedSignal], ...]:
+        Processes consecutive detections and returns the events that have
+        started or ended across all of them, in frame order.
     """
 
-    def __init__(self, total_frames: int, ttl: int):
-        self._total_frames = total_frames
-        self._event_dict = {}
-        self._active_events = {}
-        self._ttl = ttl
-
-    def _get_starting_events(self) -> List[EventStartedSignal]:
+    def __init__(self, total_frames: int, ttl: int,
+                 max_classes: int = 256) -> None:
+        self._total_frames: int = total_frames
+        # kept in least recently detected order, so the oldest entries are
+        # the first to be evicted once max_classes is exceeded
+        self._event_dict: OrderedDictType[str, Event] = OrderedDict()
+        self._active_events: Dict[str, str] = {}
+        self._ttl: int = ttl
+        self._max_classes: int = max_classes
+        # event ids only need to be unique within a run: a random prefix
+        # per instance plus a counter avoids an os.urandom call per event
+        self._run_prefix: str = secrets.token_hex(4)
+        self._id_counter: Iterator[int] = itertools.count()
+
+    def _collect_events(self,
+                        current_frame_classes: Set[str],
+                        _ESS: Type[EventStartedSignal] = EventStartedSignal,
+                        _EES: Type[EventEndedSignal] = EventEndedSignal
+                        ) -> List[Union[EventStartedSignal, EventEndedSignal]]:
         """
-        Identifies objects that have just appeared and generates the
-        corresponding event signals.
-
-        :return: A list of EventStartedSignal objects representing the events
-        of new object appearances.
+        Identifies objects that have just appeared or disappeared, generates
+        the corresponding event signals and drops expired events, in a single
+        pass over the event dictionary. Events whose class is not in the
+        current frame have their time-to-live decreased in the same pass.
+
+        :param current_frame_classes: The set of classIds predicted in the
+        current frame.
+        :return: A list with the EventStartedSignal objects of new object
+        appearances followed by the EventEndedSignal objects of object
+        disappearances.
+
+        The signal classes are bound as default arguments so the loop uses
+        fast local lookups instead of module globals.
         """
-        events = []
-
-        for k, event in self._event_dict.items():
-            if self._is_start_event(k, event):
-                event_id = str(uuid4())
-                events.append(EventStartedSignal(event_id, event.detection))
-                self._active_events[k] = event_id
-
-        return events
-
-    def _get_ending_events(self) -> List[EventEndedSignal]:
+        start: List[EventStartedSignal] = []
+        end: List[EventEndedSignal] = []
+        num_expired = 0
+        active = self._active_events
+        ed = self._event_dict
+
+        for k, event in ed.items():
+            if (event.num_detected_frames >= self._total_frames
+                    and k not in active):
+                event_id = f"{self._run_prefix}-{next(self._id_counter)}"
+                start.append(_ESS(event_id, event.detection))
+                active[k] = event_id
+
+            if k not in current_frame_classes:
+                event.current_ttl -= 1
+
+            if event.current_ttl <= 0:
+                num_expired += 1
+                active_id = active.pop(k, None)
+                if active_id is not None:
+                    end.append(_EES(active_id, event.detection))
+
+        if num_expired:
+            self._drop_expired(num_expired)
+
+        return start + end
+
+    def _age_events(self,
+                    _EES: Type[EventEndedSignal] = EventEndedSignal
+                    ) -> List[EventEndedSignal]:
         """
-        Identifies objects that have disappeared and generates the
-        corresponding event signals.
+        Fast path for frames without predictions: decreases the time-to-live
+        of every event, drops the expired ones and returns the corresponding
+        event signals. No event can start on such a frame, since no detection
+        count changed, so the start check is skipped.
 
         :return: A list of EventEndedSignal objects representing the events
         of object disappearances.
         """
-        events = []
-        del_events = []
+        end: List[EventEndedSignal] = []
+        num_expired = 0
+        active = self._active_events
 
         for k, event in self._event_dict.items():
-            if not event.is_expired():
-                continue
+            event.current_ttl -= 1
+            if event.current_ttl <= 0:
+                num_expired += 1
+                active_id = active.pop(k, None)
+                if active_id is not None:
+                    end.append(_EES(active_id, event.detection))
 
-            del_events.append(k)
+        if num_expired:
+            self._drop_expired(num_expired)
 
-            if self._is_end_event(k):
-                events.append(EventEndedSignal(self._active_events[k],
-                                               event.detection))
-                del self._active_events[k]
+        return end
 
-        for k in del_events:
-            del self._event_dict[k]
-
-        return events
-
-    def _is_start_event(self, key: str, event: Event) -> bool:
+    def _drop_expired(self, num_expired: int) -> None:
         """
-        Determines if a detected object should be considered as a new event.
+        Removes the expired events from the event dictionary. It is only
+        called when some event expired, so frames without expirations skip
+        this pass and its allocations entirely. When more than a quarter of
+        the events expired, the dictionary is rebuilt without them instead of
+        deleting each key, which also compacts its hash table.
 
-        :param key: The key associated with the detected object in the event
-        dictionary.
-        :param event: The Event object associated with the detected object.
-        :return: True if the detected object should be considered as a newly
-        appearing object, False otherwise.
+        :param num_expired: The number of expired events.
         """
-        if event.num_detected_frames < self._total_frames:
-            return False
-
-        if key in self._active_events:
-            return False
-
-        return True
+        ed = self._event_dict
+        if num_expired > len(ed) // 4:
+            self._event_dict = OrderedDict(
+                (k, event) for k, event in ed.items()
+                if event.current_ttl > 0)
+        else:
+            for k in [k for k, event in ed.items() if event.current_ttl <= 0]:
+                del ed[k]
+
+    def _evict_events(self,
+                      _EES: Type[EventEndedSignal] = EventEndedSignal
+                      ) -> List[EventEndedSignal]:
+        """
+        Evicts the least recently detected events while more than max_classes
+        classes are tracked. Evicted events that were active are ended, so no
+        started event is left without its ending signal.
 
-    def _is_end_event(self, key: str) -> bool:
+        :return: A list of EventEndedSignal objects for the evicted active
+        events.
+        """
+        end: List[EventEndedSignal] = []
+        active = self._active_events
+        ed = self._event_dict
+
+        while len(ed) > self._max_classes:
+            k, event = ed.popitem(last=False)
+            active_id = active.pop(k, None)
+            if active_id is not None:
+                end.append(_EES(active_id, event.detection))
+
+        return end
+
+    def _process_frame(self,
+                       detection: Detection,
+                       current_frame_classes: Set[str]
+                       ) -> List[Union[EventStartedSignal, EventEndedSignal]]:
         """
-        Checks whether an event is still active.
+        Updates the tracked events with the classes detected in one frame.
 
-        :param key: The key associated with the detected object in the event
-        dictionary.
-        :return: True if event is not active, False otherwise.
+        :param detection: The Detection object of the frame.
+        :param current_frame_classes: The set of classIds predicted in the
+        frame.
+        :return: A list of the events that started or ended in this frame.
         """
-        if key not in self._active_events:
-            return False
+        ed = self._event_dict
+        get_event = ed.get
+        move_to_end = ed.move_to_end
+        for cls in current_frame_classes:
+            event = get_event(cls)
+            if event is None:
+                ed[cls] = Event(detection, self._ttl)
+            else:
+                event.new_detection(detection)
+                move_to_end(cls)
+
+        all_events = self._collect_events(current_frame_classes)
+
+        if len(self._event_dict) > self._max_classes:
+            all_events += self._evict_events()
 
-        return True
+        return all_events
 
     def process(self,
                 detection: Detection
-                ) -> List[Union[EventEndedSignal, EventStartedSignal]]:
+                ) -> Tuple[Union[EventEndedSignal, EventStartedSignal], ...]:
         """
         Process a detection and generate a list of event signals based on its
         properties and behavior.
@@ -189,29 +292,58 @@ class RoIBusinessLogic(BusinessLogic):
             about the objects detected in a video frame.
 
         Returns:
-            List[Union[EventEndedSignal, EventStartedSignal]]: A list of event
-            signals generated based on the properties and behavior of the
-            objects detected in the video frame. Each signal is an instance of
-            either the EventStartedSignal or EventEndedSignal class.
-        """
-        current_frame_classes = set()
-        for pred in detection["predictions"]:
-            current_frame_classes.add(pred["classId"])
-            if pred["classId"] not in self._event_dict:
-                new_event = Event(detection, self._ttl)
-                self._event_dict[pred["classId"]] = new_event
-            else:
-                self._event_dict[pred["classId"]].new_detection(detection)
+            Tuple[Union[EventEndedSignal, EventStartedSignal], ...]: A tuple
+            of event signals generated based on the properties and behavior
+            of the objects detected in the video frame, empty if no event
+            started or ended. Each signal is an instance of either the
+            EventStartedSignal or EventEndedSignal class.
+        """
+        predictions = detection["predictions"]
+        if not predictions:
+            end_events = self._age_events()
+            return tuple(end_events) if end_events else _EMPTY
 
-        active_events_classes = set(self._event_dict.keys())
-        classes_not_in_frame = active_events_classes - current_frame_classes
+        current_frame_classes = {pred["classId"] for pred in predictions}
+        all_events = self._process_frame(detection, current_frame_classes)
 
-        for cls in classes_not_in_frame:
-            self._event_dict[cls].no_detection()
+        return tuple(all_events) if all_events else _EMPTY
+
+    def process_batch(self,
+                      detections: List[Detection]
+                      ) -> Tuple[Union[EventEndedSignal,
+                                       EventStartedSignal], ...]:
+        """
+        Process a batch of consecutive detections in a single call.
 
-        start_events = self._get_starting_events()
-        end_events = self._get_ending_events()
+        The result is the same as calling `process` on each detection in
+        order and concatenating the returned signals. A detection whose
+        predictions are malformed (e.g. missing "classId") is logged and
+        skipped, and the remaining frames are still processed.
 
-        all_events = start_events + end_events
+        Parameters:
+        -----------
+            detections (List[Detection]): Consecutive Detection objects, in
+            frame order.
+
+        Returns:
+            Tuple[Union[EventEndedSignal, EventStartedSignal], ...]: The
+            event signals generated by all frames of the batch, in frame
+            order, empty if no event started or ended.
+        """
+        all_events: List[Union[EventEndedSignal, EventStartedSignal]] = []
+        process_frame = self._process_frame
+        age_events = self._age_events
+        for detection in detections:
+            try:
+                current_frame_classes = {pred["classId"]
+                                         for pred in detection["predictions"]}
+            except (KeyError, TypeError):
+                logger.exception("Skipping malformed detection in batch")
+                continue
+
+            if current_frame_classes:
+                all_events += process_frame(detection, current_frame_classes)
+            else:
+                all_events += age_events()
 
-        return all_events if all_events else None
+        return tuple(all_events) if all_events else _EMPTY
@@ -1,6 +1,15 @@
 import json
+import time
+import queue
+import atexit
 import base64
-from typing import Union
+import logging
+import functools
+import itertools
+import weakref
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Tuple, Union
 
 from eventfactory.pipeline import (Detection,
                                    EventPipeline,
@@ -9,37 +18,144 @@ from eventfactory.pipeline import (Detection,
 from .roi import RegionOfInterest
 from .business_logic import RoIBusinessLogic
 
+# objetos que disparam o alerta para o funcionario
+_FORBIDDEN = frozenset({"backpack", "handbag"})
+
+logger = logging.getLogger(__name__)
+
+
+class _ForwardHandler(logging.Handler):
+    """
+    Entrega os registros da fila ao logger do modulo, que segue a hierarquia
+    configurada pela aplicacao (nivel, handlers e formatters).
+    """
+
+    def emit(self, record):
+        logger.handle(record)
+
+
+# os alertas passam por uma fila e sao emitidos pela thread do
+# QueueListener, assim o processamento dos frames nao fica bloqueado
+# esperando os handlers configurados
+_alert_logger = logger.getChild("alerta")
+_alert_logger.propagate = False
+_log_queue = queue.Queue()
+_alert_logger.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, _ForwardHandler())
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
+
+@functools.lru_cache(maxsize=64)
+def _alert_once(class_id: str, second: int) -> None:
+    # o cache faz com que cada classe gere no maximo um aviso por segundo,
+    # mesmo que o objeto continue visivel em todos os frames
+    _alert_logger.warning("%s encontrada! Avise o funcionario", class_id)
+
+
+# tamanho maximo das filas entre os estagios do pipeline
+_STAGE_QUEUE_SIZE = 8
+
+_EMPTY = ()
+# sentinela que encerra as threads dos estagios
+_STOP = object()
+
+
+@functools.lru_cache(maxsize=32)
+def _decode_area_of_interest(area_of_interest_b64: str) -> dict:
+    # decodificado uma unica vez por config, mesmo que o Pipeline seja
+    # recriado (por exemplo um Pipeline por video)
+    return json.loads(base64.b64decode(area_of_interest_b64))
+
+
+@functools.lru_cache(maxsize=32)
+def _decode_params(params_b64: str) -> dict:
+    return json.loads(base64.b64decode(params_b64).decode("utf8"))
+
+
+def _roi_worker(region_of_interest, roi_q, bl_q, out_q):
+    while True:
+        item = roi_q.get()
+        if item is _STOP:
+            bl_q.put(_STOP)
+            return
+
+        seq, detection = item
+        try:
+            detection = region_of_interest.process(detection)
+        except Exception:
+            # o frame e descartado, mas quem chamou recebe uma resposta
+            logger.exception("Falha ao filtrar o frame %d pela ROI", seq)
+            out_q.put((seq, _EMPTY))
+            continue
+        bl_q.put((seq, detection))
+
+
+def _bl_worker(business_logic, bl_q, out_q):
+    while True:
+        item = bl_q.get()
+        if item is _STOP:
+            return
+
+        seq, detection = item
+        try:
+            events = business_logic.process(detection)
+        except Exception:
+            logger.exception("Falha na regra de negocio do frame %d", seq)
+            events = _EMPTY
+        out_q.put((seq, events))
+
 
 class Pipeline(EventPipeline):
 
     def __init__(self, cfg):
         area_of_interest_b64 = cfg.use_case.area_of_interest
-        area_of_interest = json.loads(base64.b64decode(area_of_interest_b64))
+        area_of_interest = _decode_area_of_interest(area_of_interest_b64)
         region_coords = area_of_interest["polygon"]["coordinates"]
 
         self._region_of_interest = RegionOfInterest(region_coords)
 
         params_b64 = cfg.use_case.params
-        params = json.loads(base64.b64decode(params_b64).decode("utf8"))
+        params = _decode_params(params_b64)
         min_occurrences = params["minOcurrences"]
         max_outliers = params["maxOutliers"]
 
         self._business_logic = RoIBusinessLogic(min_occurrences, max_outliers)
 
-    def alerta(self, predictions):
+        # estagios ROI -> regra de negocio rodam em threads proprias, ligadas
+        # por filas limitadas; cada frame leva um numero de sequencia usado
+        # nos logs de falha dos estagios
+        self._seq = itertools.count()
+        self._roi_q = queue.Queue(maxsize=_STAGE_QUEUE_SIZE)
+        self._bl_q = queue.Queue(maxsize=_STAGE_QUEUE_SIZE)
+        self._out_q = queue.Queue()
+
+        # as threads nao guardam referencia ao Pipeline, assim ele pode ser
+        # coletado; o finalizer envia o sentinela e as threads terminam
+        self._workers = (
+            threading.Thread(target=_roi_worker, daemon=True,
+                             args=(self._region_of_interest, self._roi_q,
+                                   self._bl_q, self._out_q)),
+            threading.Thread(target=_bl_worker, daemon=True,
+                             args=(self._business_logic,
+                                   self._bl_q, self._out_q)),
+        )
+        for worker in self._workers:
+            worker.start()
+        self._finalizer = weakref.finalize(self, self._roi_q.put, _STOP)
+        self._finalizer.atexit = False
 
-        for i in range(len(predictions)):                           # FOR loop que percorre a lista de predictions 
-            classId = predictions[i]['classId']                     # atribui a variavel classId o value do objeto identificado pela IA
-            if classId == 'backpack' or classId == 'handbag':       # verifica se o objeto é um objeto 'proibido'
-                print(classId + " encontrada! Avise o funcionario") # se for retorna true e printa
-                return True
-            else:
-                return False                                        # se nao retorna false
+    def alerta(self, predictions):
+        # procura o primeiro objeto 'proibido' entre as predictions
+        hit = next((p["classId"] for p in predictions
+                    if p["classId"] in _FORBIDDEN), None)
+        if hit:
+            _alert_once(hit, int(time.time()))
+            return True
+        return False
 
-    def process_detection(self, detection: Detection) -> Union[
-                                                        None,
-                                                        EventEndedSignal,
-                                                        EventStartedSignal]:
+    def process_detection(self, detection: Detection) -> Tuple[
+            Union[EventEndedSignal, EventStartedSignal], ...]:
 
         """
             detection retorna um dict com as seguintes keys:
@@ -51,14 +167,34 @@ class Pipeline(EventPipeline):
 
             onde o key predictions é uma lista de dict com as previsões da IA
             e dentro dessa lista de dict há o key 'classId' que tem como value o objeto identificado pela IA
+
+            o ROI e a regra de negocio rodam nas threads dos estagios, e o
+            metodo espera o resultado do proprio frame, entao o retorno sao
+            sempre os eventos que comecaram ou terminaram neste frame.
         """
 
+        if not self._finalizer.alive:
+            raise RuntimeError("O pipeline ja foi encerrado com close()")
+
         predictions = detection['predictions']
         self.alerta(predictions)
 
-        detection = self._region_of_interest.process(detection)
-        event = self._business_logic.process(detection)
+        # os estagios alteram uma copia rasa, nunca o dict de quem chamou
+        detection = dict(detection, predictions=list(predictions))
+        self._roi_q.put((next(self._seq), detection))
 
-        return event
+        # cada frame e entregue so depois do anterior ter sido respondido,
+        # entao o proximo resultado da fila e sempre o deste frame
+        _, events = self._out_q.get()
 
-    
\ No newline at end of file
+        return events
+
+    def close(self) -> None:
+        """
+            Encerra as threads dos estagios. Depois disso process_detection
+            levanta RuntimeError.
+        """
+        if self._finalizer.detach() is not None:
+            self._roi_q.put(_STOP)
+            for worker in self._workers:
+                worker.join()
@@ -6,7 +6,18 @@ from shapely.geometry import polygon
 
 class RegionOfInterest(PipelineStep):
     def __init__(self, region: List) -> None:
+        polygon_points = [(point['x'], point['y']) for point in region]
+        if len(polygon_points) < 3:
+            raise ValueError("The region of interest needs at least 3 points, "
+                             f"got {len(polygon_points)}")
+
+        region_polygon = polygon.Polygon(polygon_points)
+        if not region_polygon.is_valid:
+            raise ValueError("The region of interest is not a valid polygon: "
+                             f"{polygon_points}")
+
         self._region = region
+        self._region_polygon = region_polygon
 
     def process(self, detection: Detection) -> Detection:
         predictions = filter(self.__pred_is_inside_region,
@@ -33,7 +44,4 @@ class RegionOfInterest(PipelineStep):
         x_mean = (bbox_x_min + bbox_x_max) // 2
         person_foot = geometry.Point(x_mean, bbox_y_max)
 
-        polygon_points = [(point['x'], point['y']) for point in self._region]
-        region_polygon = polygon.Polygon(polygon_points)
-
-        return region_polygon.contains(person_foot)
+        return self._region_polygon.contains(person_foot)
@@ -0,0 +1,23 @@
+"""
+Compila roi/business_logic.py com o mypyc, gerando uma extensao nativa que
+substitui o modulo Python sem mudar o comportamento:
+
+    pip install "mypy>=1.14"
+    python setup.py build_ext --inplace
+
+O eventfactory precisa estar instalado, pois a base BusinessLogic e
+analisada via --follow-untyped-imports (sem ela a classe base seria
+descartada na compilacao).
+"""
+from setuptools import setup
+from mypyc.build import mypycify
+
+setup(
+    name="roi",
+    packages=["roi"],
+    ext_modules=mypycify([
+        "--follow-untyped-imports",
+        "--explicit-package-bases",
+        "roi/business_logic.py",
+    ]),
+)
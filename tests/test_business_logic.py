@@ -0,0 +1,104 @@
+import random
+
+import pytest
+
+pytest.importorskip("eventfactory")
+
+from roi.business_logic import RoIBusinessLogic  # noqa: E402
+
+CLASSES = ["person", "car", "dog", "backpack", "handbag"]
+
+
+def _detection(frame, classes):
+    return {"frame": frame,
+            "predictions": [{"classId": c} for c in classes]}
+
+
+def _stream(rnd, num_frames):
+    return [_detection(f, [c for c in CLASSES if rnd.random() < 0.5])
+            for f in range(num_frames)]
+
+
+def _signature(events):
+    return [(type(e), vars(e)) for e in events]
+
+
+def _logic_pair(total_frames, ttl):
+    a = RoIBusinessLogic(total_frames, ttl)
+    b = RoIBusinessLogic(total_frames, ttl)
+    # same id prefix so both instances generate the same event ids
+    b._run_prefix = a._run_prefix
+    return a, b
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_process_batch_matches_process(seed):
+    rnd = random.Random(seed)
+    total_frames = rnd.randint(1, 4)
+    ttl = rnd.randint(1, 4)
+    batch_size = rnd.randint(1, 16)
+    frames = _stream(rnd, 64)
+
+    per_frame, batched = _logic_pair(total_frames, ttl)
+
+    expected = []
+    for detection in frames:
+        expected += per_frame.process(detection)
+
+    result = []
+    for i in range(0, len(frames), batch_size):
+        result += batched.process_batch(frames[i:i + batch_size])
+
+    assert _signature(result) == _signature(expected)
+
+
+def test_process_batch_skips_only_the_malformed_frame():
+    rnd = random.Random(0)
+    frames = _stream(rnd, 24)
+    malformed = {"frame": 99, "predictions": [{"boundingBox": {}}]}
+    per_frame, batched = _logic_pair(2, 2)
+
+    expected = []
+    for detection in frames:
+        expected += per_frame.process(detection)
+
+    result = []
+    for i in range(0, len(frames), 8):
+        batch = frames[i:i + 8]
+        result += batched.process_batch(batch[:3] + [malformed] + batch[3:])
+
+    assert _signature(result) == _signature(expected)
+
+
+def test_process_batch_empty_result_is_empty_tuple():
+    logic = RoIBusinessLogic(3, 2)
+
+    assert logic.process_batch([_detection(0, ["person"])]) == ()
+
+
+def test_eviction_ends_active_event():
+    logic = RoIBusinessLogic(1, 10, max_classes=2)
+
+    logic.process(_detection(0, ["person"]))
+    person_id = logic._active_events["person"]
+    logic.process(_detection(1, ["car"]))
+    events = logic.process(_detection(2, ["dog"]))
+
+    assert [type(e).__name__ for e in events] == ["EventStartedSignal",
+                                                  "EventEndedSignal"]
+    assert person_id in vars(events[1]).values()
+    assert "person" not in logic._event_dict
+    assert "person" not in logic._active_events
+    assert len(logic._event_dict) == 2
+
+
+def test_eviction_drops_least_recently_detected_class():
+    logic = RoIBusinessLogic(10, 10, max_classes=2)
+
+    logic.process(_detection(0, ["person", "car"]))
+    logic.process(_detection(1, ["person"]))
+    events = logic.process(_detection(2, ["dog"]))
+
+    # no event had started, so evicting "car" emits nothing
+    assert events == ()
+    assert list(logic._event_dict) == ["person", "dog"]
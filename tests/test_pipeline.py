@@ -0,0 +1,139 @@
+import gc
+import base64
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("eventfactory")
+pytest.importorskip("shapely")
+
+from roi import pipeline as pipeline_module  # noqa: E402
+from roi.pipeline import Pipeline  # noqa: E402
+from roi.business_logic import RoIBusinessLogic  # noqa: E402
+
+SQUARE = [{"x": 0, "y": 0}, {"x": 100, "y": 0},
+          {"x": 100, "y": 100}, {"x": 0, "y": 100}]
+
+
+def _b64(obj):
+    return base64.b64encode(json.dumps(obj).encode("utf8"))
+
+
+def _cfg(min_occurrences=2, max_outliers=2):
+    area_of_interest = {"polygon": {"coordinates": SQUARE}}
+    params = {"minOcurrences": min_occurrences, "maxOutliers": max_outliers}
+    return SimpleNamespace(use_case=SimpleNamespace(
+        area_of_interest=_b64(area_of_interest), params=_b64(params)))
+
+
+def _event_types(events):
+    return [type(e).__name__ for e in events]
+
+
+def _prediction(class_id, x=10):
+    return {"classId": class_id,
+            "boundingBox": {"coordinates": [{"x": x, "y": 10},
+                                            {"x": x + 5, "y": 20}]}}
+
+
+@pytest.fixture
+def pipeline():
+    pipeline = Pipeline(_cfg())
+    yield pipeline
+    pipeline.close()
+
+
+def test_alerta_finds_forbidden_class_after_a_safe_one(pipeline):
+    predictions = [_prediction("person"), _prediction("backpack")]
+
+    assert pipeline.alerta(predictions) is True
+
+
+def test_alerta_without_predictions(pipeline):
+    assert pipeline.alerta([]) is False
+
+
+def test_alerta_warns_once_per_class_per_second(pipeline, monkeypatch):
+    warnings = []
+    now = [1000.2]
+    monkeypatch.setattr(pipeline_module, "time",
+                        SimpleNamespace(time=lambda: now[0]))
+    monkeypatch.setattr(pipeline_module._alert_logger, "warning",
+                        lambda msg, class_id: warnings.append(class_id))
+    pipeline_module._alert_once.cache_clear()
+
+    for _ in range(30):
+        assert pipeline.alerta([_prediction("backpack")]) is True
+    pipeline.alerta([_prediction("handbag")])
+    now[0] = 1001.1
+    pipeline.alerta([_prediction("backpack")])
+
+    assert warnings == ["backpack", "handbag", "backpack"]
+
+
+def test_process_detection_returns_the_events_of_its_own_frame(pipeline):
+    rnd = random.Random(0)
+    reference = RoIBusinessLogic(2, 2)
+
+    for frame in range(60):
+        inside = [c for c in ("person", "car") if rnd.random() < 0.5]
+        predictions = [_prediction(c) for c in inside]
+        # outside the ROI, must never reach the business logic
+        predictions.append(_prediction("dog", x=500))
+
+        events = pipeline.process_detection({"frame": frame,
+                                             "predictions": predictions})
+        expected = reference.process(
+            {"frame": frame, "predictions": [_prediction(c) for c in inside]})
+
+        assert _event_types(events) == _event_types(expected)
+
+
+def test_final_ended_signal_is_returned_with_its_frame(pipeline):
+    frames = [[_prediction("person")]] * 3 + [[]] * 2
+    events = [pipeline.process_detection({"frame": f, "predictions": p})
+              for f, p in enumerate(frames)]
+
+    assert [_event_types(e) for e in events] == [
+        [], ["EventStartedSignal"], [], [], ["EventEndedSignal"]]
+
+
+def test_process_detection_leaves_the_callers_detection_unchanged(pipeline):
+    predictions = [_prediction("person"), _prediction("dog", x=500)]
+    detection = {"frame": 0, "predictions": predictions}
+
+    pipeline.process_detection(detection)
+
+    assert detection == {"frame": 0,
+                         "predictions": [_prediction("person"),
+                                         _prediction("dog", x=500)]}
+    assert detection["predictions"] is predictions
+
+
+def test_process_detection_after_close_raises():
+    pipeline = Pipeline(_cfg())
+    pipeline.close()
+
+    with pytest.raises(RuntimeError):
+        pipeline.process_detection({"frame": 0, "predictions": []})
+
+
+def test_close_stops_the_stage_threads():
+    pipeline = Pipeline(_cfg())
+    pipeline.close()
+    pipeline.close()
+
+    assert not any(worker.is_alive() for worker in pipeline._workers)
+
+
+def test_discarded_pipeline_stops_the_stage_threads():
+    pipeline = Pipeline(_cfg())
+    workers = pipeline._workers
+    del pipeline
+    gc.collect()
+
+    for worker in workers:
+        worker.join(timeout=5)
+    assert not any(worker.is_alive() for worker in workers)
@@ -0,0 +1,36 @@
+import pytest
+
+pytest.importorskip("eventfactory")
+pytest.importorskip("shapely")
+
+from roi.roi import RegionOfInterest  # noqa: E402
+
+
+def _points(*coords):
+    return [{"x": x, "y": y} for x, y in coords]
+
+
+def _prediction(x, y):
+    bbox = _points((x - 5, y - 20), (x + 5, y))
+    return {"classId": "person", "boundingBox": {"coordinates": bbox}}
+
+
+def test_region_with_fewer_than_three_points_is_rejected():
+    with pytest.raises(ValueError, match="at least 3 points"):
+        RegionOfInterest(_points((0, 0), (100, 100)))
+
+
+def test_self_intersecting_region_is_rejected():
+    bowtie = _points((0, 0), (100, 100), (100, 0), (0, 100))
+
+    with pytest.raises(ValueError, match="not a valid polygon"):
+        RegionOfInterest(bowtie)
+
+
+def test_square_region_filters_predictions_by_their_feet():
+    region = RegionOfInterest(_points((0, 0), (100, 0), (100, 100), (0, 100)))
+    inside, outside = _prediction(50, 50), _prediction(150, 50)
+
+    detection = region.process({"predictions": [inside, outside]})
+
+    assert detection["predictions"] == [inside]